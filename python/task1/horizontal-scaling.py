@@ -1,11 +1,18 @@
 from datetime import datetime, timezone
 import boto3
 import botocore
+from botocore.exceptions import BotoCoreError, ClientError, WaiterError
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import json
-import configparser
+import types
+import functools
+import collections
+import itertools
+import random
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from dateutil.parser import parse
 
 
@@ -15,9 +22,12 @@ from dateutil.parser import parse
 with open('horizontal-scaling-config.json') as file:
     configuration = json.load(file)
 
-LOAD_GENERATOR_AMI = configuration['load_generator_ami']
-WEB_SERVICE_AMI = configuration['web_service_ami']
-INSTANCE_TYPE = configuration['instance_type']
+# Attribute access to the configuration, read once at import
+CFG = types.SimpleNamespace(**configuration)
+
+LOAD_GENERATOR_AMI = CFG.load_generator_ami
+WEB_SERVICE_AMI = CFG.web_service_ami
+INSTANCE_TYPE = CFG.instance_type
 
 ########################################
 # Tags
@@ -27,50 +37,150 @@ tag_pairs = [
 ]
 TAGS = [{'Key': k, 'Value': v} for k, v in tag_pairs]
 
-TEST_NAME_REGEX = r'name=(.*log)'
+TEST_NAME_RE = re.compile(r'name=([^\s&"<>]+?\.log)')
+RPS_PREFIX = 'Current rps='
+# The value must be followed by the closing ']' of its log section, so a
+# value cut off mid-write is not taken for a smaller one
+RPS_RE = re.compile(re.escape(RPS_PREFIX) + r'(\d+(?:\.\d+)?)(?=\])')
+# Option names are case-insensitive in the LG log (it is INI formatted)
+START_RE = re.compile(r'^starttime\s*=\s*([^\r\n]+)', re.IGNORECASE | re.MULTILINE)
+# How much of the log end / start is scanned for the RPS / start time
+LOG_TAIL_SIZE = 8192
+LOG_HEAD_SIZE = 4096
+
+########################################
+# HTTP session
+########################################
+# Pooled session for all LG / WS requests, so polling reuses
+# connections instead of opening a new one per call. Every caller has its
+# own retry / hedging loop, so the adapter itself does not retry; otherwise
+# the two retry layers would multiply.
+HTTP_TIMEOUT = (2, 5)  # (connect, read) seconds
+
+NO_RETRY_SESSION = requests.Session()
+NO_RETRY_SESSION.mount('http://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=0
+))
+
+# Last log fetched per log name, as (fetch time, log text)
+_log_cache = {}
+
+# Length of the log last written to disk per log name
+_last_log_len = {}
+
+# Log bytes downloaded so far per log name, and the logs for which the LG
+# does not support Range requests
+_log_buffers = {}
+_log_offsets = {}
+_range_unsupported = set()
+
+# Durations of recent successful log fetches, used to time hedged requests
+_get_durations = collections.deque(maxlen=50)
+
+# Shared by all hedged requests, so a slow LG cannot pile up threads:
+# at most one original and one hedge are in flight at any time
+_hedge_executor = ThreadPoolExecutor(max_workers=2)
+
+# Target RPS of the horizontal scaling test
+TARGET_RPS = 50
+
+# EC2 errors meaning not even one more WS fits in the account limits
+CAPACITY_ERROR_CODES = ('VcpuLimitExceeded', 'InstanceLimitExceeded')
 
 ########################################
 # Utility functions
 ########################################
 
 
-def create_instance(ami, sg_id):
+def create_instances(ami, sg_id, count=1):
     """
-    Given AMI, create and return an AWS EC2 instance object
-    :param ami: AMI image name to launch the instance with
-    :param sg_id: ID of the security group to be attached to instance
-    :return: instance object
+    Given AMI, launch up to `count` AWS EC2 instances in a single request
+    :param ami: AMI image name to launch the instances with
+    :param sg_id: ID of the security group to be attached to instances
+    :param count: maximum number of instances to launch
+    :return: list of instance objects
     """
 
-    # TODO: Create an EC2 instance
-    # Wait for the instance to enter the running state
-    # Reload the instance attributes
-
     ec2 = boto3.resource('ec2', region_name='us-east-1')
-    
-    # This is to launch the instance
+    ec2_client = ec2.meta.client
+
+    # One RunInstances call for the whole batch instead of one per instance.
+    # MinCount=1 lets EC2 launch only part of the batch when the vCPU limit
+    # leaves room for fewer than `count` instances
     # Note: I must use the TAGS constant that are defined at the top of the file
-    instance = ec2.create_instances(
+    instances = ec2.create_instances(
         ImageId=ami,
         InstanceType=INSTANCE_TYPE,
         MinCount=1,
-        MaxCount=1,
+        MaxCount=count,
         SecurityGroupIds=[sg_id],
         TagSpecifications=[{
             'ResourceType': 'instance',
             'Tags': TAGS
         }]
-    )[0] # create_instances returns a list, and then I take the first one
+    )
+    instance_ids = [i.id for i in instances]
 
-    print(f"Instance {instance.id} launching... waiting for running state.")
-    
-    # To wait for the instance to be running (so that I can get the Public DNS)
-    instance.wait_until_running()
-    
-    # This reloads the instance to fetch the new attributes (like Public DNS)
-    instance.reload()
-    
-    return instance
+    print(f"Instances {instance_ids} launching... waiting for running state.")
+
+    # A single waiter covers the whole batch (so that I can get the Public DNS).
+    # The caller never sees the ids if the waiter fails, so terminate them here
+    try:
+        ec2_client.get_waiter('instance_running').wait(InstanceIds=instance_ids)
+    except WaiterError:
+        print(f"Instances {instance_ids} did not reach running state, terminating...")
+        ec2_client.terminate_instances(InstanceIds=instance_ids)
+        raise
+
+    # This reloads all instances with one describe call to fetch the new
+    # attributes (like Public DNS)
+    return list(ec2.instances.filter(InstanceIds=instance_ids))
+
+
+def create_instance(ami, sg_id):
+    """
+    Given AMI, create and return an AWS EC2 instance object
+    :param ami: AMI image name to launch the instance with
+    :param sg_id: ID of the security group to be attached to instance
+    :return: instance object
+    """
+    return create_instances(ami, sg_id, count=1)[0]
+
+
+def backoff_sleep(attempt, cap=30, response=None):
+    """
+    Sleep before the next retry, with exponential backoff and jitter
+    :param attempt: zero-based retry number
+    :param cap: maximum sleep in seconds
+    :param response: last response, if any; its Retry-After header is
+                     honoured on 429/503
+    :return: None
+    """
+    delay = 2 ** min(attempt, 10) + random.random()
+    if response is not None and response.status_code in (429, 503):
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            delay = int(retry_after)
+    time.sleep(min(cap, delay))
+
+
+def get_until_ok(url):
+    """
+    GET the url until the LG answers with 200, backing off between tries
+    :param url: url to request
+    :return: the successful response
+    """
+    for attempt in itertools.count():
+        response = None
+        try:
+            response = NO_RETRY_SESSION.get(url, timeout=HTTP_TIMEOUT)
+            if response.status_code == 200:
+                return response
+        except requests.exceptions.RequestException:
+            pass
+        backoff_sleep(attempt, response=response)
 
 
 def initialize_test(lg_dns, first_web_service_dns):
@@ -84,13 +194,7 @@ def initialize_test(lg_dns, first_web_service_dns):
     add_ws_string = 'http://{}/test/horizontal?dns={}'.format(
         lg_dns, first_web_service_dns
     )
-    response = None
-    while not response or response.status_code != 200:
-        try:
-            response = requests.get(add_ws_string)
-        except requests.exceptions.ConnectionError:
-            time.sleep(1)
-            pass 
+    response = get_until_ok(add_ws_string)
 
     # TODO: return log File name
     log_file_name = get_test_id(response)
@@ -112,30 +216,119 @@ def get_test_id(response):
     :param response: the server response.
     :return: the test name (log file name).
     """
-    response_text = response.text
+    return TEST_NAME_RE.search(response.text).group(1)
 
-    regexpr = re.compile(TEST_NAME_REGEX)
 
-    return regexpr.findall(response_text)[0]
+def hedged_get(url, hedge_after=0.5, timeout=HTTP_TIMEOUT, headers=None):
+    """
+    GET the url, sending a second identical request if the first one is
+    slower than the recent p90 latency, and return whichever answers first
+    :param url: url to request
+    :param hedge_after: hedge delay in seconds until enough latencies are known
+    :param timeout: (connect, read) timeout of each request
+    :param headers: extra request headers
+    :return: the first successful response
+    """
+    if len(_get_durations) >= 10:
+        hedge_after = sorted(_get_durations)[int(len(_get_durations) * 0.9)]
+
+    # The hedge is the retry, so neither request retries on its own
+    start = time.monotonic()
+    futures = [_hedge_executor.submit(NO_RETRY_SESSION.get, url, timeout=timeout, headers=headers)]
+    try:
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            futures.append(_hedge_executor.submit(NO_RETRY_SESSION.get, url, timeout=timeout, headers=headers))
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    _get_durations.append(time.monotonic() - start)
+                    return future.result()
+        # Every request failed: raise the error of the first one
+        return futures[0].result()
+    finally:
+        # Do not block on the request that lost the race; drop it if it
+        # has not started yet
+        for future in futures:
+            future.cancel()
 
 
-def is_test_complete(lg_dns, log_name):
+def save_log(log_name, log_text, force=False):
     """
-    Check if the horizontal scaling test has finished
+    Write the log to a local file for submission and monitoring, skipping
+    the write when the log has not grown since the last one
+    :param log_name: name of the log file
+    :param log_text: log text
+    :param force: write even if the log has not grown
+    :return: None
+    """
+    if force or len(log_text) > _last_log_len.get(log_name, -1):
+        with open(log_name + ".log", "w", buffering=1 << 16) as f:
+            f.write(log_text)
+        _last_log_len[log_name] = len(log_text)
+
+
+def fetch_log(lg_dns, log_name, max_age=0):
+    """
+    Fetch the test log from the LG
     :param lg_dns: load generator DNS
     :param log_name: name of the log file
-    :return: True if Horizontal Scaling test is complete and False otherwise.
+    :param max_age: seconds for which a previous fetch may be reused
+    :return: log text (the last fetched one if the LG cannot be reached)
     """
+    cached = _log_cache.get(log_name)
+    if cached and time.monotonic() - cached[0] <= max_age:
+        return cached[1]
 
+    # The log only ever grows, so ask for the bytes after what we already have
     log_string = 'http://{}/log?name={}'.format(lg_dns, log_name)
+    offset = _log_offsets.get(log_name, 0)
+    headers = None
+    if offset and log_name not in _range_unsupported:
+        headers = {'Range': 'bytes={}-'.format(offset)}
+    try:
+        response = hedged_get(log_string, headers=headers)
+    except requests.exceptions.RequestException as e:
+        # Skip this poll and keep working with the log we already have
+        print(f"Could not fetch log {log_name}: {e}")
+        return cached[1] if cached else ''
+
+    if response.status_code == 206:
+        _log_buffers[log_name] += response.content
+    elif response.status_code == 200:
+        if headers:
+            # The LG ignored the Range header: always fetch the full log
+            _range_unsupported.add(log_name)
+        _log_buffers[log_name] = bytearray(response.content)
+    # Anything else (e.g. 416 when nothing was appended) keeps the buffer
+
+    buffer = _log_buffers.setdefault(log_name, bytearray())
+    _log_offsets[log_name] = len(buffer)
+    log_text = buffer.decode('utf-8', errors='replace')
 
     # creates a log file for submission and monitoring
-    f = open(log_name + ".log", "w")
-    log_text = requests.get(log_string).text
-    f.write(log_text)
-    f.close()
+    save_log(log_name, log_text)
+
+    _log_cache[log_name] = (time.monotonic(), log_text)
+    return log_text
+
 
-    return '[Test finished]' in log_text
+def is_test_complete(lg_dns, log_name):
+    """
+    Check if the horizontal scaling test has finished
+    :param lg_dns: load generator DNS
+    :param log_name: name of the log file
+    :return: True if Horizontal Scaling test is complete and False otherwise.
+    """
+    log_text = fetch_log(lg_dns, log_name)
+    if '[Test finished]' in log_text:
+        # Make sure the complete log is on disk for the submission
+        save_log(log_name, log_text, force=True)
+        return True
+    return False
 
 
 def add_web_service_instance(lg_dns, sg2_id, log_name):
@@ -154,13 +347,71 @@ def add_web_service_instance(lg_dns, sg2_id, log_name):
         lg_dns,
         ins.public_dns_name
     )
-    while True:
-        if requests.get(add_req).status_code == 200:
+    for attempt in itertools.count():
+        response = None
+        try:
+            response = NO_RETRY_SESSION.get(add_req, timeout=HTTP_TIMEOUT)
+        except requests.exceptions.RequestException:
+            pass
+        if response is not None and response.status_code == 200:
             print("New WS submitted to LG.")
             break
         elif is_test_complete(lg_dns, log_name):
             print("New WS not submitted because test already completed.")
             break
+        backoff_sleep(attempt, response=response)
+
+
+def add_ws_batch(lg_dns, dns_list, max_attempts=5):
+    """
+    Add WS instances to the running test, one request per WS, sent concurrently
+    :param lg_dns: load generator DNS
+    :param dns_list: DNS names of the WS instances to add; when it is a
+                     generator, each WS is submitted as soon as it is yielded
+    :param max_attempts: attempts per WS
+    :return: list of the DNS names the LG accepted
+    """
+    def add_one(dns):
+        add_url = 'http://{}/test/horizontal/add?dns={}'.format(lg_dns, dns)
+        for attempt in range(max_attempts):
+            response = None
+            try:
+                response = NO_RETRY_SESSION.get(add_url, timeout=HTTP_TIMEOUT)
+                if response.status_code == 200:
+                    print(f"New WS {dns} successfully added.")
+                    return True
+            except requests.exceptions.RequestException:
+                pass
+            if attempt + 1 < max_attempts:
+                backoff_sleep(attempt, response=response)
+        print(f"Error adding {dns} to LG.")
+        return False
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {executor.submit(add_one, dns): dns for dns in dns_list}
+        return [futures[f] for f in as_completed(futures) if f.result()]
+
+
+@functools.lru_cache(maxsize=4)
+def parse_log_rps(log_text):
+    """
+    Return the latest RPS recorded in the log text
+    :param log_text: full log text
+    :return: latest RPS value
+    """
+    # The latest RPS is always near the end of the log, so search the
+    # tail backwards and stop at the latest complete entry (the last one
+    # may have no value yet if the log was fetched mid-write)
+    tail_start = max(0, len(log_text) - LOG_TAIL_SIZE)
+    end = len(log_text)
+    while True:
+        start = log_text.rfind(RPS_PREFIX, tail_start, end)
+        if start == -1:
+            return 0.0
+        match = RPS_RE.match(log_text, start)
+        if match:
+            return float(match.group(1))
+        end = start
 
 
 def get_rps(lg_dns, log_name):
@@ -170,18 +421,8 @@ def get_rps(lg_dns, log_name):
     :param log_name: name of log file
     :return: latest RPS value
     """
-
-    log_string = 'http://{}/log?name={}'.format(lg_dns, log_name)
-    config = configparser.ConfigParser(strict=False)
-    config.read_string(requests.get(log_string).text)
-    sections = config.sections()
-    sections.reverse()
-    rps = 0
-    for sec in sections:
-        if 'Current rps=' in sec:
-            rps = float(sec[len('Current rps='):])
-            break
-    return rps
+    # Reuse the log fetched by is_test_complete in the same poll iteration
+    return parse_log_rps(fetch_log(lg_dns, log_name, max_age=1))
 
 
 def get_test_start_time(lg_dns, log_name):
@@ -191,29 +432,53 @@ def get_test_start_time(lg_dns, log_name):
     :param log_name: name of log file
     :return: datetime object of the start time in UTC
     """
-    log_string = 'http://{}/log?name={}'.format(lg_dns, log_name)
     start_time = None
     while start_time is None:
-        config = configparser.ConfigParser(strict=False)
-        config.read_string(requests.get(log_string).text)
-        # By default, options names in a section are converted
-        # to lower case by configparser
-        start_time = dict(config.items('Test')).get('starttime', None)
+        # The [Test] section with the start time is at the top of the log
+        match = START_RE.search(fetch_log(lg_dns, log_name)[:LOG_HEAD_SIZE])
+        if match:
+            start_time = match.group(1).strip()
+        else:
+            time.sleep(1)
     return parse(start_time)
 
 
 
-def wait_for_server_health(dns_name):
+def predict_rps(samples, horizon=30):
+    """
+    Project the RPS ahead with a least-squares line over recent RPS updates
+    :param samples: (time, rps) pairs, oldest first, one per change of the
+                    logged RPS value
+    :param horizon: seconds to project ahead
+    :return: projected RPS
+    """
+    recent = list(samples)
+    n = len(recent)
+    last_rps = recent[-1][1]
+    # Two points are a single step, not a trend
+    if n < 3:
+        return last_rps
+
+    mean_t = sum(t for t, _ in recent) / n
+    mean_rps = sum(rps for _, rps in recent) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in recent)
+    if var_t == 0:
+        return last_rps
+    slope = sum((t - mean_t) * (rps - mean_rps) for t, rps in recent) / var_t
+    return last_rps + slope * horizon
+
+
+def wait_for_server_health(dns_name, timeout=80):
     """
     The function waits until the server is actually reachable via HTTP.
     """
     print(f"Waiting for {dns_name} to boot web application...")
     url = f"http://{dns_name}"
     retries = 0
-    # Wait up to ~80 seconds for the app to start
-    while retries < 40: 
+    # Wait up to ~timeout seconds for the app to start (2s per retry)
+    while retries < timeout // 2:
         try:
-            resp = requests.get(url, timeout=1)
+            resp = NO_RETRY_SESSION.get(url, timeout=(1, 2))
             if resp.status_code == 200:
                 print(f"Server {dns_name} is READY!")
                 return True
@@ -227,6 +492,50 @@ def wait_for_server_health(dns_name):
     return False
 
 
+def wait_for_servers_health(dns_list, timeout=80):
+    """
+    Health-check several servers concurrently
+    :param dns_list: DNS names of the servers to check
+    :param timeout: seconds to wait for each server
+    :return: generator of (dns, is_healthy) pairs in completion order
+    """
+    if not dns_list:
+        return
+    with ThreadPoolExecutor(max_workers=len(dns_list)) as executor:
+        futures = {
+            executor.submit(wait_for_server_health, dns, timeout): dns
+            for dns in dns_list
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def delete_security_group(sg):
+    """
+    Delete a security group once no network interface uses it anymore
+    :param sg: security group object
+    :return: None
+    """
+    ec2_client = sg.meta.client
+
+    # Terminated instances can hold on to their network interfaces for a
+    # little while, and the SG cannot be deleted until they are released
+    for _ in range(30):
+        enis = ec2_client.describe_network_interfaces(
+            Filters=[{'Name': 'group-id', 'Values': [sg.id]}]
+        )['NetworkInterfaces']
+        if not enis:
+            break
+        time.sleep(2)
+
+    try:
+        sg.delete()
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'DependencyViolation':
+            raise
+        time.sleep(5)
+        sg.delete()
+
 
 ########################################
 # Main routine
@@ -300,6 +609,13 @@ def main():
         # Set timer to now so the program starts the first cooldown immediately
         last_launch_time = datetime.now(timezone.utc)
 
+        # (time, rps) of the recent changes of the logged RPS. The LG updates
+        # the value in steps, so only polls that see a new value are sampled;
+        # fitting every 1s poll would see long flat runs and steep jumps
+        rps_samples = collections.deque(maxlen=10)
+        # Set once EC2 reports that no more instances can be launched
+        capacity_reached = False
+
         # RULE 8: Loop strictly based on is_test_complete
         while not is_test_complete(lg_dns, log_name):
             
@@ -307,46 +623,70 @@ def main():
             current_rps = get_rps(lg_dns, log_name)
             current_time = datetime.now(timezone.utc)
             time_diff = (current_time - last_launch_time).total_seconds()
+
+            # Project RPS 30s ahead so that a WS that is still ramping up
+            # does not trigger another launch
+            if not rps_samples or rps_samples[-1][1] != current_rps:
+                rps_samples.append((time.monotonic(), current_rps))
+            predicted_rps = predict_rps(rps_samples)
             
-            print(f"RPS: {current_rps} | Time since last launch: {time_diff:.2f}s")
+            print(f"RPS: {current_rps} (predicted {predicted_rps:.2f}) | Time since last launch: {time_diff:.2f}s")
 
             # SCALING LOGIC
             # RULE 4: Dynamic check (RPS < 50) and Cooldown (> 100s)
-            if current_rps < 50 and time_diff > 100:
-                print("RPS is low. Attempting to launch new WS...")
-                
+            if (not capacity_reached and current_rps < TARGET_RPS
+                    and predicted_rps < TARGET_RPS and time_diff > 100):
+                # The LG only accepts one new WS per 100s cooldown, so a
+                # bigger batch would leave instances running unregistered
+                print("RPS is low. Attempting to launch a new WS...")
+
                 try:
-                    # RULE 2 & 4: Launch instance dynamically (No hardcoded limit)
-                    # If the program hits the 16 vCPU limit, the 'except' block below catches it.
-                    new_ws = create_instance(WEB_SERVICE_AMI, sg2_id)
-                    all_instance_ids.append(new_ws.id)
-                    
-                    # This is to reload to ensure that the program has the Public DNS
-                    new_ws.reload()
-                    new_ws_dns = new_ws.public_dns_name
-                    
-                    if not new_ws_dns:
-                        print("Error: Instance has no DNS name yet.")
-                        # If failed, the program loops again; next iter will retry or wait
-                        continue
-
-                    if wait_for_server_health(new_ws_dns):
-                        # This adds to Load Generator
-                        add_url = f'http://{lg_dns}/test/horizontal/add?dns={new_ws_dns}'
-                        res = requests.get(add_url)
-                        
-                        if res.status_code == 200:
-                            # This resets the cooldown only after a successful addition
-                            last_launch_time = datetime.now(timezone.utc)
-                            print(f"New WS {new_ws.id} successfully added.")
+                    # RULE 2 & 4: Launch instances dynamically (No hardcoded limit)
+                    # If the program hits the 16 vCPU limit, the 'except' block below stops scaling.
+                    new_instances = create_instances(WEB_SERVICE_AMI, sg2_id, count=1)
+                    all_instance_ids.extend(i.id for i in new_instances)
+
+                    new_ws_dns_list = []
+                    for new_ws in new_instances:
+                        if new_ws.public_dns_name:
+                            new_ws_dns_list.append(new_ws.public_dns_name)
                         else:
-                            print(f"Error adding to LG: {res.status_code}")
+                            print(f"Error: Instance {new_ws.id} has no DNS name yet.")
+
+                    # Health-check the batch concurrently and register each WS
+                    # with the LG as soon as it is ready, instead of waiting
+                    # for the slowest one
+                    healthy_dns = (
+                        dns for dns, healthy in wait_for_servers_health(new_ws_dns_list)
+                        if healthy
+                    )
+                    # This adds to Load Generator
+                    added = add_ws_batch(lg_dns, healthy_dns)
+                    if added:
+                        # This resets the cooldown only after a successful addition
+                        last_launch_time = datetime.now(timezone.utc)
+
+                    # A WS that failed its health check or was refused by the
+                    # LG would only be billed: terminate it right away
+                    unused_ids = [i.id for i in new_instances if i.public_dns_name not in added]
+                    if unused_ids:
+                        ec2_client.terminate_instances(InstanceIds=unused_ids)
+                        for instance_id in unused_ids:
+                            all_instance_ids.remove(instance_id)
+                        print(f"Terminated unregistered WS: {unused_ids}")
+
+                except ClientError as e:
+                    if e.response['Error']['Code'] in CAPACITY_ERROR_CODES:
+                        capacity_reached = True
+                        print(f"Scaling stopped, no more capacity: {e}")
                     else:
-                        print("Skipping add: Server failed health check.")
+                        # e.g. InsufficientInstanceCapacity is transient: retry
+                        # after a cooldown instead of on every poll
+                        last_launch_time = datetime.now(timezone.utc)
+                        print(f"Scaling paused (AWS error): {e}")
+                except (WaiterError, requests.exceptions.RequestException) as e:
+                    print(f"Scaling paused: {e}")
 
-                except Exception as e:
-                    print(f"Scaling paused (likely AWS limit or error): {e}")
-            
             # RULE 4: Sleep must be <= 1 second for polling
             time.sleep(1)
 
@@ -358,19 +698,27 @@ def main():
         # ---------------------------------------------------------
         print_section('Cleanup: Terminating Resources')
         if all_instance_ids:
-            ec2.instances.filter(InstanceIds=all_instance_ids).terminate()
-            print(f"Terminated instances: {all_instance_ids}")
-        
-        # Cleanup Security Group (wait for instances to terminate first)
+            try:
+                # One batched terminate call, then wait for the whole batch
+                ec2_client.terminate_instances(InstanceIds=all_instance_ids)
+                print(f"Terminated instances: {all_instance_ids}")
+                print("Waiting for instances to terminate...")
+                waiter = ec2_client.get_waiter('instance_terminated')
+                waiter.wait(
+                    InstanceIds=all_instance_ids,
+                    WaiterConfig={'Delay': 5, 'MaxAttempts': 60}
+                )
+            except (ClientError, BotoCoreError) as e:
+                # Still try to delete the SG below
+                print(f"Error terminating instances: {e}")
+
+        # Cleanup Security Group (once its network interfaces are released)
         if 'sg' in locals():
-            print("Waiting for instances to terminate before deleting SG...")
-            # A simple wait loop for SG deletion
-            time.sleep(60) 
             try:
-                sg.delete()
+                delete_security_group(sg)
                 print("Security Group deleted.")
-            except Exception as e:
-                print(f"Could not delete SG (usually because instances are still terminating): {e}")
+            except (ClientError, BotoCoreError) as e:
+                print(f"Could not delete SG: {e}")
 
 
 if __name__ == '__main__':
@@ -1,9 +1,16 @@
 import boto3
 import botocore
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, WaiterError
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import json
+import types
 import re
+import itertools
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 ########################################
 # Constants
@@ -11,17 +18,30 @@ import re
 with open('auto-scaling-config.json') as file:
     configuration = json.load(file)
 
-LOAD_GENERATOR_AMI = configuration['load_generator_ami']
-WEB_SERVICE_AMI = configuration['web_service_ami']
-INSTANCE_TYPE = configuration['instance_type']
+# Attribute access to the configuration, read once at import
+CFG = types.SimpleNamespace(**configuration)
+
+LOAD_GENERATOR_AMI = CFG.load_generator_ami
+WEB_SERVICE_AMI = CFG.web_service_ami
+INSTANCE_TYPE = CFG.instance_type
+ASG_NAME = CFG.auto_scaling_group_name
+LT_NAME = CFG.launch_template_name
+TG_NAME = CFG.auto_scaling_target_group
+LB_NAME = CFG.load_balancer_name
 
 ########################################
 # Clients
 ########################################
-ec2 = boto3.client('ec2')
-elbv2 = boto3.client('elbv2')
-asg_client = boto3.client('autoscaling')
-cw_client = boto3.client('cloudwatch')
+# Adaptive retries back off properly when AWS throttles us, and a bigger
+# connection pool lets concurrent calls run without queueing
+BOTO_CONFIG = Config(
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+    max_pool_connections=32
+)
+ec2 = boto3.client('ec2', config=BOTO_CONFIG)
+elbv2 = boto3.client('elbv2', config=BOTO_CONFIG)
+asg_client = boto3.client('autoscaling', config=BOTO_CONFIG)
+cw_client = boto3.client('cloudwatch', config=BOTO_CONFIG)
 
 ########################################
 # Tags
@@ -31,7 +51,39 @@ tag_pairs = [
 ]
 TAGS = [{'Key': k, 'Value': v} for k, v in tag_pairs]
 
-TEST_NAME_REGEX = r'name=(.*log)'
+TEST_NAME_RE = re.compile(r'name=([^\s&"<>]+?\.log)')
+
+########################################
+# HTTP session
+########################################
+# Pooled session for all LG / WS requests, so polling reuses
+# connections instead of opening a new one per call. Every caller has its
+# own retry / hedging loop, so the adapter itself does not retry; otherwise
+# the two retry layers would multiply.
+HTTP_TIMEOUT = (2, 5)  # (connect, read) seconds
+
+NO_RETRY_SESSION = requests.Session()
+NO_RETRY_SESSION.mount('http://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=0
+))
+
+# AWS limit on instance ids per TerminateInstances call
+TERMINATE_BATCH_SIZE = 1000
+
+# Seconds the target group drains a deregistered target (AWS default: 300)
+TG_DEREGISTRATION_DELAY = 30
+
+# How many times (2s apart) to check whether new instances are running
+# (600s in total, the same budget as the instance_running waiter)
+RUNNING_POLL_ATTEMPTS = 300
+
+# How many times (5s apart) to check whether the ASG is gone
+ASG_DELETE_MAX_ATTEMPTS = 60
+
+# Length of the log last written to disk per log name
+_last_log_len = {}
 
 ########################################
 # Utility functions
@@ -47,31 +99,218 @@ def get_subnets(vpc_id):
     response = ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
     return [subnet['SubnetId'] for subnet in response['Subnets']]
 
-def create_instance(ami, sg_id):
+def create_instances(ami, sg_id, count=1):
     """
-    Given AMI, create and return an AWS EC2 instance object
+    Given AMI, launch `count` AWS EC2 instances in a single request
+    and return their descriptions
     """
-    print(f"Now launching instance with AMI: {ami}...")
+    print(f"Now launching {count} instance(s) with AMI: {ami}...")
     response = ec2.run_instances(
         ImageId=ami,
         InstanceType=INSTANCE_TYPE,
         SecurityGroupIds=[sg_id],
-        MinCount=1,
-        MaxCount=1,
+        MinCount=count,
+        MaxCount=count,
         TagSpecifications=[{'ResourceType': 'instance', 'Tags': TAGS}]
     )
-    instance_id = response['Instances'][0]['InstanceId']
+    instance_ids = [i['InstanceId'] for i in response['Instances']]
     
-    # To wait for the running state
-    print(f"Now waiting for the instance {instance_id} to be running...")
-    waiter = ec2.get_waiter('instance_running')
-    waiter.wait(InstanceIds=[instance_id])
-    
-    # To reload the instance info to get DNS
-    desc = ec2.describe_instances(InstanceIds=[instance_id])
+    # To wait for the running state. Polling describe_instances directly
+    # returns the DNS in the same call that sees the instances running,
+    # so no extra describe is needed after a waiter
+    print(f"Now waiting for the instances {instance_ids} to be running...")
+    for _ in range(RUNNING_POLL_ATTEMPTS):
+        try:
+            desc = ec2.describe_instances(InstanceIds=instance_ids)
+        except ClientError as e:
+            # EC2 is eventually consistent: new ids may not be visible yet
+            if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+                raise
+            time.sleep(2)
+            continue
+        # To access the inside reservations
+        instances = [i for r in desc['Reservations'] for i in r['Instances']]
+        if all(i['State']['Name'] == 'running' and i.get('PublicDnsName')
+               for i in instances):
+            return instances
+        time.sleep(2)
+    raise TimeoutError(f"Instances {instance_ids} did not reach the running state")
+
+def create_instance(ami, sg_id):
+    """
+    Given AMI, create and return an AWS EC2 instance object
+    """
+    return create_instances(ami, sg_id, count=1)[0]
+
+def backoff_sleep(attempt, cap=30, response=None):
+    """
+    Sleep before the next retry, with exponential backoff and jitter
+    :param attempt: zero-based retry number
+    :param cap: maximum sleep in seconds
+    :param response: last response, if any; its Retry-After header is
+                     honoured on 429/503
+    :return: None
+    """
+    delay = 2 ** min(attempt, 10) + random.random()
+    if response is not None and response.status_code in (429, 503):
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            delay = int(retry_after)
+    time.sleep(min(cap, delay))
+
+def get_until_ok(url):
+    """
+    GET the url until the LG answers with 200, backing off between tries
+    :param url: url to request
+    :return: the successful response
+    """
+    for attempt in itertools.count():
+        response = None
+        try:
+            response = NO_RETRY_SESSION.get(url, timeout=HTTP_TIMEOUT)
+            if response.status_code == 200:
+                return response
+        except requests.exceptions.RequestException:
+            pass
+        backoff_sleep(attempt, response=response)
+
+def run_parallel(tasks):
+    """
+    Run independent setup steps concurrently.
+    :param tasks: dict of name -> zero-argument callable
+    :return: dict of name -> result of the callable
+    """
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = {executor.submit(fn): name for name, fn in tasks.items()}
+        return {futures[f]: f.result() for f in as_completed(futures)}
+
+def create_security_group(name, description, vpc_id, ports):
+    """
+    Create a security group open to the world on the given TCP ports
+    and return its ID
+    """
+    sg_id = ec2.create_security_group(GroupName=name, Description=description, VpcId=vpc_id)['GroupId']
+    for port in ports:
+        ec2.authorize_security_group_ingress(
+            GroupId=sg_id,
+            IpPermissions=[{'IpProtocol': 'tcp', 'FromPort': port, 'ToPort': port, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
+        )
+    return sg_id
+
+def create_launch_template(sg_id):
+    """Create the launch template of the web service instances."""
+    ec2.create_launch_template(
+        LaunchTemplateName=LT_NAME,
+        LaunchTemplateData={
+            'ImageId': WEB_SERVICE_AMI,
+            'InstanceType': INSTANCE_TYPE,
+            'SecurityGroupIds': [sg_id],
+            'TagSpecifications': [{'ResourceType': 'instance', 'Tags': TAGS}],
+            'Monitoring': {'Enabled': True} 
+        }
+    )
+    print(f"Launch Template {LT_NAME} created.")
+
+def create_target_group(vpc_id):
+    """Create the target group and return its ARN."""
+    tg_resp = elbv2.create_target_group(
+        Name=TG_NAME,
+        Protocol='HTTP',
+        Port=80,
+        VpcId=vpc_id,
+        HealthCheckProtocol='HTTP',
+        HealthCheckPath='/',
+        TargetType='instance'
+    )
+    tg_arn = tg_resp['TargetGroups'][0]['TargetGroupArn']
+    # The default 300s draining would hold up the scale-in wait before the test
+    elbv2.modify_target_group_attributes(
+        TargetGroupArn=tg_arn,
+        Attributes=[{'Key': 'deregistration_delay.timeout_seconds',
+                     'Value': str(TG_DEREGISTRATION_DELAY)}]
+    )
+    print(f"Target Group created: {tg_arn}")
+    return tg_arn
+
+def create_load_balancer(subnets, sg_id):
+    """
+    Create the application load balancer, wait until it is active
+    and return its ARN and DNS name
+    """
+    lb_resp = elbv2.create_load_balancer(
+        Name=LB_NAME,
+        Subnets=subnets,
+        SecurityGroups=[sg_id],
+        Scheme='internet-facing',
+        Tags=TAGS,
+        Type='application'
+    )
+    lb_arn = lb_resp['LoadBalancers'][0]['LoadBalancerArn']
+    lb_dns = lb_resp['LoadBalancers'][0]['DNSName']
     
-    # To access the inside reservations
-    return desc['Reservations'][0]['Instances'][0]
+    print("Waiting for Load Balancer to be active...")
+    lb_waiter = elbv2.get_waiter('load_balancer_available')
+    lb_waiter.wait(LoadBalancerArns=[lb_arn])
+    print("lb started. ARN={}, DNS={}".format(lb_arn, lb_dns))
+    return lb_arn, lb_dns
+
+def create_listener(lb_arn, tg_arn):
+    """Forward HTTP traffic of the load balancer to the target group."""
+    elbv2.create_listener(
+        LoadBalancerArn=lb_arn,
+        Protocol='HTTP',
+        Port=80,
+        DefaultActions=[{'Type': 'forward', 'TargetGroupArn': tg_arn}]
+    )
+    print("Listener created.")
+
+def create_auto_scaling_group(subnets, tg_arn):
+    """Create the ASG of web service instances behind the target group."""
+    asg_client.create_auto_scaling_group(
+        AutoScalingGroupName=ASG_NAME,
+        LaunchTemplate={
+            'LaunchTemplateName': LT_NAME,
+            'Version': '$Latest'
+        },
+        MinSize=CFG.asg_min_size,
+        MaxSize=CFG.asg_max_size,
+        DesiredCapacity=1,
+        DefaultCooldown=CFG.asg_default_cool_down_period,
+        TargetGroupARNs=[tg_arn],
+        VPCZoneIdentifier=",".join(subnets),
+        Tags=[{'Key': 'Project', 'Value': 'vm-scaling', 'PropagateAtLaunch': True}],
+        HealthCheckType='EC2',
+        HealthCheckGracePeriod=CFG.health_check_grace_period
+    )
+    print(f"ASG {ASG_NAME} created.")
+
+def create_scaling_policy_with_alarm(policy_name, adjustment, cooldown,
+                                     alarm_name, evaluation_periods, threshold, comparison):
+    """
+    Attach a simple scaling policy to the ASG and a CloudWatch CPU alarm
+    that triggers it
+    """
+    policy_resp = asg_client.put_scaling_policy(
+        AutoScalingGroupName=ASG_NAME,
+        PolicyName=policy_name,
+        PolicyType='SimpleScaling',
+        AdjustmentType='ChangeInCapacity',
+        ScalingAdjustment=adjustment,
+        Cooldown=cooldown
+    )
+    cw_client.put_metric_alarm(
+        AlarmName=alarm_name,
+        MetricName='CPUUtilization',
+        Namespace='AWS/EC2',
+        Statistic='Average',
+        Dimensions=[{'Name': 'AutoScalingGroupName', 'Value': ASG_NAME}],
+        Period=CFG.alarm_period,
+        EvaluationPeriods=evaluation_periods,
+        Threshold=threshold,
+        ComparisonOperator=comparison,
+        AlarmActions=[policy_resp['PolicyARN']]
+    )
+    print(f"{policy_name} and {alarm_name} created.")
 
 def initialize_test(load_generator_dns, first_web_service_dns):
     """
@@ -89,13 +328,7 @@ def initialize_test(load_generator_dns, first_web_service_dns):
     add_ws_string = 'http://{}/autoscaling?dns={}'.format(
         load_generator_dns, first_web_service_dns
     )
-    response = None
-    while not response or response.status_code != 200:
-        try:
-            response = requests.get(add_ws_string)
-        except requests.exceptions.ConnectionError:
-            time.sleep(1)
-            pass 
+    response = get_until_ok(add_ws_string)
     # To return the log File name
     return get_test_id(response)
 
@@ -115,20 +348,12 @@ def initialize_warmup(load_generator_dns, load_balancer_dns):
     add_ws_string = 'http://{}/warmup?dns={}'.format(
         load_generator_dns, load_balancer_dns
     )
-    response = None
-    while not response or response.status_code != 200:
-        try:
-            response = requests.get(add_ws_string)
-        except requests.exceptions.ConnectionError:
-            time.sleep(1)
-            pass  
+    response = get_until_ok(add_ws_string)
     # To return the log File name
     return get_test_id(response)
 
 def get_test_id(response):
-    response_text = response.text
-    regexpr = re.compile(TEST_NAME_REGEX)
-    return regexpr.findall(response_text)[0]
+    return TEST_NAME_RE.search(response.text).group(1)
 
 def destroy_resources():
     """
@@ -140,35 +365,37 @@ def destroy_resources():
     try:
         print("Now deleting the Auto Scaling Group...")
         asg_client.delete_auto_scaling_group(
-            AutoScalingGroupName=configuration['auto_scaling_group_name'],
+            AutoScalingGroupName=ASG_NAME,
             ForceDelete=True
         )
-        while True:
-            try:
-                desc = asg_client.describe_auto_scaling_groups(
-                    AutoScalingGroupNames=[configuration['auto_scaling_group_name']]
-                )
-                if not desc['AutoScalingGroups']:
-                    break 
-                if desc['AutoScalingGroups'][0]['Status'] == 'Delete in progress':
-                    print("ASG deletion in progress...")
-                    time.sleep(5)
-            except:
+        paginator = asg_client.get_paginator('describe_auto_scaling_groups')
+        for _ in range(ASG_DELETE_MAX_ATTEMPTS):
+            pages = paginator.paginate(
+                AutoScalingGroupNames=[ASG_NAME]
+            )
+            if not any(g for page in pages for g in page['AutoScalingGroups']):
                 break
-    except Exception as e:
+            print("ASG deletion in progress...")
+            time.sleep(5)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ValidationError':
+            print("ASG already deleted.")
+        else:
+            print(f"There was an error while deleting ASG: {e}")
+    except BotoCoreError as e:
         print(f"There was an error while deleting ASG: {e}")
 
     # 2. To delete the Launch template
     try:
         print("Now deleting the launch template...")
-        ec2.delete_launch_template(LaunchTemplateName=configuration['launch_template_name'])
-    except Exception as e:
+        ec2.delete_launch_template(LaunchTemplateName=LT_NAME)
+    except (ClientError, BotoCoreError) as e:
         print(f"Error deleting LT: {e}")
 
     # 3. To delete the Load Balancer
     lb_arn = None
     try:
-        lbs = elbv2.describe_load_balancers(Names=[configuration['load_balancer_name']])
+        lbs = elbv2.describe_load_balancers(Names=[LB_NAME])
         if lbs['LoadBalancers']:
             lb_arn = lbs['LoadBalancers'][0]['LoadBalancerArn']
             print("Deleting Load Balancer...")
@@ -177,19 +404,23 @@ def destroy_resources():
             print("Waiting for LB deletion...")
             waiter = elbv2.get_waiter('load_balancers_deleted')
             waiter.wait(LoadBalancerArns=[lb_arn])
-            # To give AWS a moment to release the Target Group lock
-            time.sleep(10) 
-    except Exception as e:
+    except (ClientError, BotoCoreError) as e:
         print(f"Error deleting LB: {e}")
 
     # 4. To delete the Target Group
     try:
-        tgs = elbv2.describe_target_groups(Names=[configuration['auto_scaling_target_group']])
+        tgs = elbv2.describe_target_groups(Names=[TG_NAME])
         if tgs['TargetGroups']:
             tg_arn = tgs['TargetGroups'][0]['TargetGroupArn']
+            # To wait until the deleted LB has released the Target Group
+            for _ in range(30):
+                if not tgs['TargetGroups'][0]['LoadBalancerArns']:
+                    break
+                time.sleep(2)
+                tgs = elbv2.describe_target_groups(Names=[TG_NAME])
             print("Deleting Target Group...")
             elbv2.delete_target_group(TargetGroupArn=tg_arn)
-    except Exception as e:
+    except (ClientError, BotoCoreError) as e:
         print(f"Error deleting TG: {e}")
 
     # 5. To delete the Load Generator Instance
@@ -207,18 +438,32 @@ def destroy_resources():
                 ids_to_term.append(i['InstanceId'])
         
         if ids_to_term:
-            ec2.terminate_instances(InstanceIds=ids_to_term)
+            # TerminateInstances accepts at most 1000 ids per call
+            chunks = [ids_to_term[i:i + TERMINATE_BATCH_SIZE]
+                      for i in range(0, len(ids_to_term), TERMINATE_BATCH_SIZE)]
+            for chunk in chunks:
+                ec2.terminate_instances(InstanceIds=chunk)
             print(f"Terminating: {ids_to_term}")
             waiter = ec2.get_waiter('instance_terminated')
-            waiter.wait(InstanceIds=ids_to_term)
-    except Exception as e:
+            with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+                futures = [
+                    executor.submit(
+                        waiter.wait,
+                        InstanceIds=chunk,
+                        WaiterConfig={'Delay': 5, 'MaxAttempts': 60}
+                    )
+                    for chunk in chunks
+                ]
+                for future in futures:
+                    future.result()
+    except (ClientError, BotoCoreError) as e:
         print(f"Error terminating instances: {e}")
 
     # 6. To delete the CloudWatch Alarms
     try:
         print("Now deleting the CloudWatch Alarms...")
         cw_client.delete_alarms(AlarmNames=['ScaleOutAlarm', 'ScaleInAlarm'])
-    except Exception as e:
+    except (ClientError, BotoCoreError) as e:
         print(f"Error deleting alarms: {e}")
 
 
@@ -226,20 +471,65 @@ def print_section(msg):
     print(('#' * 40) + '\n# ' + msg + '\n' + ('#' * 40))
 
 
+def save_log(log_name, log_text, force=False):
+    """
+    Write the log to a local file for submission and monitoring, skipping
+    the write when the log has not grown since the last one
+    :param log_name: name of the log file
+    :param log_text: log text
+    :param force: write even if the log has not grown
+    :return: None
+    """
+    if force or len(log_text) > _last_log_len.get(log_name, -1):
+        with open(log_name + ".log", "w", buffering=1 << 16) as f:
+            f.write(log_text)
+        _last_log_len[log_name] = len(log_text)
+
+
 def is_test_complete(load_generator_dns, log_name):
     log_string = 'http://{}/log?name={}'.format(load_generator_dns, log_name)
-    f = open(log_name + ".log", "w")
     try:
-        log_text = requests.get(log_string).text
-        f.write(log_text)
-    except:
-        pass
-    f.close()
-    
-    # To read file to check content
-    with open(log_name + ".log", "r") as f:
-        content = f.read()
-        return '[Test finished]' in content
+        log_text = NO_RETRY_SESSION.get(log_string, timeout=HTTP_TIMEOUT).text
+    except requests.exceptions.RequestException:
+        return False
+
+    # To check the content in memory; the file is only kept for submission
+    finished = '[Test finished]' in log_text
+    save_log(log_name, log_text, force=finished)
+    return finished
+
+
+def poll_until_complete(load_generator_dns, log_name, base=60, min_interval=10):
+    """
+    Poll the LG until the test finishes. The interval is halved while the
+    log keeps growing and doubled (up to base) while it is idle.
+    """
+    interval = base
+    while True:
+        last_len = _last_log_len.get(log_name, -1)
+        if is_test_complete(load_generator_dns, log_name):
+            return
+        if _last_log_len.get(log_name, -1) > last_len:
+            interval = max(min_interval, interval // 2)
+        else:
+            interval = min(base, interval * 2)
+        time.sleep(interval)
+
+
+def wait_for_asg_size(name, target, timeout=300):
+    """
+    Wait until the ASG has `target` InService instances and return their IDs
+    """
+    deadline = time.time() + timeout
+    while True:
+        group = asg_client.describe_auto_scaling_groups(AutoScalingGroupNames=[name])['AutoScalingGroups'][0]
+        in_service = [i['InstanceId'] for i in group['Instances'] if i['LifecycleState'] == 'InService']
+        if len(in_service) == target:
+            return in_service
+        if time.time() >= deadline:
+            print(f"ASG still has {len(in_service)} instances in service after {timeout}s, moving on.")
+            return in_service
+        time.sleep(5)
 
 
 ########################################
@@ -250,189 +540,85 @@ def main():
         vpc_id = get_default_vpc()
         subnets = get_subnets(vpc_id)
         
+        # Independent resources are created concurrently, phase by phase;
+        # each phase only needs results of the phases before it
         print_section('1 - create two security groups')
-        sg_lg_name = f"sg_lg_{int(time.time())}"
-        sg1_resp = ec2.create_security_group(GroupName=sg_lg_name, Description="LG SG", VpcId=vpc_id)
-        sg1_id = sg1_resp['GroupId']
-        ec2.authorize_security_group_ingress(
-            GroupId=sg1_id,
-            IpPermissions=[{'IpProtocol': 'tcp', 'FromPort': 80, 'ToPort': 80, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
-        )
-        ec2.authorize_security_group_ingress(
-            GroupId=sg1_id,
-            IpPermissions=[{'IpProtocol': 'tcp', 'FromPort': 22, 'ToPort': 22, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
-        )
+        sgs = run_parallel({
+            'lg': lambda: create_security_group(
+                f"sg_lg_{int(time.time())}", "LG SG", vpc_id, [80, 22]),
+            'web': lambda: create_security_group(
+                f"sg_web_{int(time.time())}", "Web/ELB SG", vpc_id, [80]),
+        })
+        sg1_id, sg2_id = sgs['lg'], sgs['web']
         print(f"Created LG SG: {sg1_id}")
-
-        sg_web_name = f"sg_web_{int(time.time())}"
-        sg2_resp = ec2.create_security_group(GroupName=sg_web_name, Description="Web/ELB SG", VpcId=vpc_id)
-        sg2_id = sg2_resp['GroupId']
-        ec2.authorize_security_group_ingress(
-            GroupId=sg2_id,
-            IpPermissions=[{'IpProtocol': 'tcp', 'FromPort': 80, 'ToPort': 80, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
-        )
         print(f"Created Web SG: {sg2_id}")
 
-        print_section('2 - create LG')
-        lg_instance = create_instance(LOAD_GENERATOR_AMI, sg1_id)
-        lg_id = lg_instance['InstanceId']
-        lg_dns = lg_instance['PublicDnsName']
+        print_section('2 - create LG, LT (Launch Template), TG (Target Group) and ELB')
+        resources = run_parallel({
+            'lg': lambda: create_instance(LOAD_GENERATOR_AMI, sg1_id),
+            'lt': lambda: create_launch_template(sg2_id),
+            'tg': lambda: create_target_group(vpc_id),
+            'lb': lambda: create_load_balancer(subnets, sg2_id),
+        })
+        lg_id = resources['lg']['InstanceId']
+        lg_dns = resources['lg']['PublicDnsName']
         print("Load Generator running: id={} dns={}".format(lg_id, lg_dns))
-
-        print_section('3. Create LT (Launch Template)')
-        lt_name = configuration['launch_template_name']
-        ec2.create_launch_template(
-            LaunchTemplateName=lt_name,
-            LaunchTemplateData={
-                'ImageId': WEB_SERVICE_AMI,
-                'InstanceType': INSTANCE_TYPE,
-                'SecurityGroupIds': [sg2_id],
-                'TagSpecifications': [{'ResourceType': 'instance', 'Tags': TAGS}],
-                'Monitoring': {'Enabled': True} 
-            }
-        )
-        print(f"Launch Template {lt_name} created.")
-
-        print_section('4. Create TG (Target Group)')
-        tg_name = configuration['auto_scaling_target_group']
-        tg_resp = elbv2.create_target_group(
-            Name=tg_name,
-            Protocol='HTTP',
-            Port=80,
-            VpcId=vpc_id,
-            HealthCheckProtocol='HTTP',
-            HealthCheckPath='/',
-            TargetType='instance'
-        )
-        tg_arn = tg_resp['TargetGroups'][0]['TargetGroupArn']
-        print(f"Target Group created: {tg_arn}")
-
-        print_section('5. Create ELB (Application Load Balancer)')
-        lb_name = configuration['load_balancer_name']
-        lb_resp = elbv2.create_load_balancer(
-            Name=lb_name,
-            Subnets=subnets,
-            SecurityGroups=[sg2_id],
-            Scheme='internet-facing',
-            Tags=TAGS,
-            Type='application'
-        )
-        lb_arn = lb_resp['LoadBalancers'][0]['LoadBalancerArn']
-        lb_dns = lb_resp['LoadBalancers'][0]['DNSName']
-        
-        print("Waiting for Load Balancer to be active...")
-        lb_waiter = elbv2.get_waiter('load_balancer_available')
-        lb_waiter.wait(LoadBalancerArns=[lb_arn])
-        print("lb started. ARN={}, DNS={}".format(lb_arn, lb_dns))
-
-        print_section('6. Associate ELB with target group')
-        elbv2.create_listener(
-            LoadBalancerArn=lb_arn,
-            Protocol='HTTP',
-            Port=80,
-            DefaultActions=[{'Type': 'forward', 'TargetGroupArn': tg_arn}]
-        )
-        print("Listener created.")
-
-        print_section('7. Create ASG (Auto Scaling Group)')
-        asg_name = configuration['auto_scaling_group_name']
-        asg_client.create_auto_scaling_group(
-            AutoScalingGroupName=asg_name,
-            LaunchTemplate={
-                'LaunchTemplateName': lt_name,
-                'Version': '$Latest'
-            },
-            MinSize=configuration['asg_min_size'],
-            MaxSize=configuration['asg_max_size'],
-            DesiredCapacity=1,
-            DefaultCooldown=configuration['asg_default_cool_down_period'],
-            TargetGroupARNs=[tg_arn],
-            VPCZoneIdentifier=",".join(subnets),
-            Tags=[{'Key': 'Project', 'Value': 'vm-scaling', 'PropagateAtLaunch': True}],
-            HealthCheckType='EC2',
-            HealthCheckGracePeriod=configuration['health_check_grace_period']
-        )
-        print(f"ASG {asg_name} created.")
-
-        print_section('8. Create policy and attached to ASG')
-        scale_out_resp = asg_client.put_scaling_policy(
-            AutoScalingGroupName=asg_name,
-            PolicyName='ScaleOutPolicy',
-            PolicyType='SimpleScaling',
-            AdjustmentType='ChangeInCapacity',
-            ScalingAdjustment=configuration['scale_out_adjustment'],
-            Cooldown=configuration['cool_down_period_scale_out']
-        )
-        scale_out_arn = scale_out_resp['PolicyARN']
-
-        scale_in_resp = asg_client.put_scaling_policy(
-            AutoScalingGroupName=asg_name,
-            PolicyName='ScaleInPolicy',
-            PolicyType='SimpleScaling',
-            AdjustmentType='ChangeInCapacity',
-            ScalingAdjustment=configuration['scale_in_adjustment'],
-            Cooldown=configuration['cool_down_period_scale_in']
-        )
-        scale_in_arn = scale_in_resp['PolicyARN']
-        print("Scaling policies created.")
-
-        print_section('9. Create Cloud Watch alarm.')
-        cw_client.put_metric_alarm(
-            AlarmName='ScaleOutAlarm',
-            MetricName='CPUUtilization',
-            Namespace='AWS/EC2',
-            Statistic='Average',
-            Dimensions=[{'Name': 'AutoScalingGroupName', 'Value': asg_name}],
-            Period=configuration['alarm_period'],
-            EvaluationPeriods=configuration['alarm_evaluation_periods_scale_out'],
-            Threshold=configuration['cpu_upper_threshold'],
-            ComparisonOperator='GreaterThanThreshold',
-            AlarmActions=[scale_out_arn]
-        )
-        cw_client.put_metric_alarm(
-            AlarmName='ScaleInAlarm',
-            MetricName='CPUUtilization',
-            Namespace='AWS/EC2',
-            Statistic='Average',
-            Dimensions=[{'Name': 'AutoScalingGroupName', 'Value': asg_name}],
-            Period=configuration['alarm_period'],
-            EvaluationPeriods=configuration['alarm_evaluation_periods_scale_in'],
-            Threshold=configuration['cpu_lower_threshold'],
-            ComparisonOperator='LessThanThreshold',
-            AlarmActions=[scale_in_arn]
-        )
-        print("CloudWatch Alarms created.")
-
-        print_section('10. Submit ELB DNS to LG, starting warm up test.')
+        tg_arn = resources['tg']
+        lb_arn, lb_dns = resources['lb']
+
+        print_section('3. Associate ELB with target group and create ASG (Auto Scaling Group)')
+        run_parallel({
+            'listener': lambda: create_listener(lb_arn, tg_arn),
+            'asg': lambda: create_auto_scaling_group(subnets, tg_arn),
+        })
+
+        print_section('4. Create policies attached to ASG and Cloud Watch alarms')
+        run_parallel({
+            'scale_out': lambda: create_scaling_policy_with_alarm(
+                'ScaleOutPolicy', CFG.scale_out_adjustment, CFG.cool_down_period_scale_out,
+                'ScaleOutAlarm', CFG.alarm_evaluation_periods_scale_out,
+                CFG.cpu_upper_threshold, 'GreaterThanThreshold'),
+            'scale_in': lambda: create_scaling_policy_with_alarm(
+                'ScaleInPolicy', CFG.scale_in_adjustment, CFG.cool_down_period_scale_in,
+                'ScaleInAlarm', CFG.alarm_evaluation_periods_scale_in,
+                CFG.cpu_lower_threshold, 'LessThanThreshold'),
+        })
+
+        print_section('5. Submit ELB DNS to LG, starting warm up test.')
         time.sleep(10)
         warmup_log_name = initialize_warmup(lg_dns, lb_dns)
         print(f"Warmup log: {warmup_log_name}")
-        while not is_test_complete(lg_dns, warmup_log_name):
-            time.sleep(10)
+        poll_until_complete(lg_dns, warmup_log_name)
 
         # -------------------------------------------------------------
         # To RESET ASG TO 1 BEFORE MAIN TEST
         # -------------------------------------------------------------
-        print_section('10.5. Reset ASG to 1 instance before main test')
+        print_section('5.5. Reset ASG to 1 instance before main test')
         print("The warmup likely scaled the ASG up. Forcing scale down to 1 to save budget...")
         asg_client.update_auto_scaling_group(
-            AutoScalingGroupName=asg_name,
+            AutoScalingGroupName=ASG_NAME,
             DesiredCapacity=1
         )
-        # To give it 60 seconds to terminate the extra instances
-        time.sleep(60)
+        # To wait for the extra instances to leave the ASG and the TG
+        in_service = wait_for_asg_size(ASG_NAME, 1)
+        targets = elbv2.describe_target_health(TargetGroupArn=tg_arn)['TargetHealthDescriptions']
+        leaving = [{'Id': t['Target']['Id']} for t in targets if t['Target']['Id'] not in in_service]
+        if leaving:
+            try:
+                elbv2.get_waiter('target_deregistered').wait(TargetGroupArn=tg_arn, Targets=leaving)
+            except WaiterError as e:
+                print(f"Targets still draining, moving on: {e}")
         # -------------------------------------------------------------
 
-        print_section('11. Submit ELB DNS to LG, starting auto scaling test.')
+        print_section('6. Submit ELB DNS to LG, starting auto scaling test.')
         log_name = initialize_test(lg_dns, lb_dns)
         print(f"Test log: {log_name}")
-        while not is_test_complete(lg_dns, log_name):
-            time.sleep(20)
+        poll_until_complete(lg_dns, log_name)
 
-        destroy_resources()
-        
     except Exception as e:
         print(f"CRITICAL ERROR: {e}")
+    finally:
+        # Also runs on KeyboardInterrupt so that nothing is left running
         destroy_resources()
 
 if __name__ == "__main__":